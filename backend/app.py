@@ -1,26 +1,45 @@
 import os
 import logging
-from fastapi import FastAPI
+import queue
+import orjson
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.security import HTTPBearer
 from dotenv import load_dotenv
-from routes import auth_router, search_router, sources_router
 
-# Load environment variables
-load_dotenv()
+# Load environment variables (deployments that inject env vars directly can set SKIP_DOTENV=1).
+# This must run before the routes/services imports below: their singletons read
+# their settings (JWT_SECRET, BCRYPT_ROUNDS, DB_WRITE_DELAY, ...) when created.
+if os.getenv("SKIP_DOTENV") != "1":
+    load_dotenv()
+
+from routes import auth_router, search_router, sources_router
+from services.db import db
+from services.nasa_service import close_client as close_nasa_client
 
 # Get environment variables
 DEV_MODE = os.getenv("DEV_MODE", "false").lower() == "true"
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
-# Configure logging
+# Configure logging - records are queued on the request path and written to
+# stderr by a listener thread, so log I/O never blocks the event loop
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+)
+log_listener = QueueListener(log_queue, log_stream_handler)
+log_queue_handler = QueueHandler(log_queue)
+# Only merge the message args here; the listener's handler applies the full format
+log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
 logging.basicConfig(
     level=logging.INFO if DEV_MODE else logging.WARNING,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[log_queue_handler],
 )
+log_listener.start()
 logger = logging.getLogger(__name__)
 
 # FastAPI app configuration
@@ -40,15 +59,53 @@ if not DEV_MODE:
 
 app = FastAPI(**app_config)
 
-# Security middleware - add trusted host middleware first
-if not DEV_MODE:
-    app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=ALLOWED_HOSTS
-    )
+# Security headers middleware (pure ASGI, avoids BaseHTTPMiddleware overhead)
+SECURITY_HEADERS = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    (b"content-security-policy", b"default-src 'self'"),
+)
+
+class SecurityHeadersMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # One C-level concatenation instead of per-header appends
+                message["headers"] = [*message.get("headers", ()), *SECURITY_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class OriginlessFastPathCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware that short-circuits requests without an Origin header.
 
-# Add GZip compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+    Same-origin and non-browser requests need no CORS processing, so they skip
+    Starlette's header parsing; only the Vary: Origin header it would have added
+    is appended, keeping shared caches correct.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or any(name == b"origin" for name, _ in scope["headers"]):
+            await super().__call__(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (b"vary", b"Origin")]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
 
 # CORS configuration based on environment
 if DEV_MODE:
@@ -72,44 +129,52 @@ else:
         "X-Requested-With",
     ]
 
+# Middleware runs in reverse registration order (the last one added sees the
+# request first), so the request path is TrustedHost -> CORS -> security
+# headers -> GZip and rejected or preflight requests never reach compression.
+
+# Add GZip compression (level 5 trades a little ratio for much less CPU than the default 9)
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=5)
+
+if not DEV_MODE:
+    # Add security headers for production
+    app.add_middleware(SecurityHeadersMiddleware)
+
 app.add_middleware(
-    CORSMiddleware,
+    OriginlessFastPathCORSMiddleware,
     allow_origins=cors_origins,
+    allow_origin_regex=None,
     allow_credentials=True,
     allow_methods=cors_methods,
     allow_headers=cors_headers,
     expose_headers=["Content-Range", "X-Content-Range"] if not DEV_MODE else ["*"],
 )
 
-# Security headers middleware
-@app.middleware("http")
-async def add_security_headers(request, call_next):
-    response = await call_next(request)
-    
-    if not DEV_MODE:
-        # Add security headers for production
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Content-Security-Policy"] = "default-src 'self'"
-    
-    return response
+# Security middleware - trusted host is added last so it rejects bad hosts first
+if not DEV_MODE:
+    app.add_middleware(
+        TrustedHostMiddleware,
+        allowed_hosts=ALLOWED_HOSTS
+    )
+
+# Static bodies for the root and health endpoints, encoded once at startup
+ENVIRONMENT = "development" if DEV_MODE else "production"
+ROOT_BODY = orjson.dumps({
+    "message": "Space Explorer API is running",
+    "version": "1.0.0",
+    "environment": ENVIRONMENT
+})
+HEALTH_BODY = orjson.dumps({"status": "healthy", "environment": ENVIRONMENT})
 
 # Root endpoint
 @app.get("/")
 async def root():
-    return {
-        "message": "Space Explorer API is running",
-        "version": "1.0.0",
-        "environment": "development" if DEV_MODE else "production"
-    }
+    return Response(content=ROOT_BODY, media_type="application/json")
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "environment": "development" if DEV_MODE else "production"}
+    return Response(content=HEALTH_BODY, media_type="application/json")
 
 # Include routers
 app.include_router(auth_router)
@@ -119,8 +184,15 @@ app.include_router(sources_router)
 # Log startup information
 @app.on_event("startup")
 async def startup_event():
-    logger.info(f"Space Explorer API starting in {'development' if DEV_MODE else 'production'} mode")
+    logger.info(f"Space Explorer API starting in {ENVIRONMENT} mode")
     if DEV_MODE:
         logger.info("Development mode: API docs available at /docs and /redoc")
     else:
         logger.info("Production mode: API docs disabled for security")
+
+# Close shared clients, write pending database changes and flush queued log records on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_nasa_client()
+    db.flush()
+    log_listener.stop()
@@ -1,9 +1,11 @@
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class Source(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore", validate_assignment=False)
+
     id: str
     name: str
     type: str
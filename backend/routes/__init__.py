@@ -5,6 +5,7 @@ This package contains all the API route definitions organized by functionality:
 - auth.py: Authentication routes (signup, login)
 - search.py: Search history routes (get, delete)
 - sources.py: NASA sources and images routes (get sources)
+- deps.py: Shared route dependencies (authenticated user)
 """
 
 from .auth import router as auth_router
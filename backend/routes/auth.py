@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, status, Header
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError, field_validator
 from typing import Dict, Any, Optional
 from services.authentication import auth_service
 
@@ -13,13 +13,22 @@ class SignupRequest(BaseModel):
     last_name: str
 
 class LoginRequest(BaseModel):
-    email: EmailStr
+    # Plain str with a cheap sanity check; full EmailStr validation only runs on signup
+    email: str
     password: str
 
+    @field_validator("email")
+    @classmethod
+    def check_email(cls, v: str) -> str:
+        if "@" not in v or len(v) >= 254:
+            raise ValueError("Invalid email address")
+        return v
+
 class ValidateTokenRequest(BaseModel):
     token: str
 
 # Response models
+# Validated from the service's user dict (extra keys are ignored); see _user_response.
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -49,6 +58,19 @@ class MeResponse(BaseModel):
     message: str
     user: UserResponse
 
+def _user_response(user_data: Dict[str, Any]) -> UserResponse:
+    """
+    Build a UserResponse from the service's user dict.
+    
+    Stored users aren't guaranteed to have every field, so the dict is validated.
+    A mismatch is a server-side data problem, so it is raised as RuntimeError
+    (a 500 in the routes) rather than the ValueError the routes report as a 400.
+    """
+    try:
+        return UserResponse.model_validate(user_data)
+    except ValidationError as e:
+        raise RuntimeError(f"Stored user does not match UserResponse: {e}") from e
+
 @router.post("/signup", response_model=SignupResponse, status_code=status.HTTP_201_CREATED)
 async def signup(request: SignupRequest):
     """
@@ -76,13 +98,7 @@ async def signup(request: SignupRequest):
             return SignupResponse(
                 success=True,
                 message=message,
-                user=UserResponse(
-                    id=user_data["id"],
-                    email=user_data["email"],
-                    first_name=user_data["first_name"],
-                    last_name=user_data["last_name"],
-                    created_at=user_data["created_at"]
-                ),
+                user=_user_response(user_data),
                 token=token
             )
         else:
@@ -129,13 +145,7 @@ async def login(request: LoginRequest):
                 success=True,
                 message=message,
                 token=token,
-                user=UserResponse(
-                    id=user_data["id"],
-                    email=user_data["email"],
-                    first_name=user_data["first_name"],
-                    last_name=user_data["last_name"],
-                    created_at=user_data["created_at"]
-                )
+                user=_user_response(user_data)
             )
         else:
             raise HTTPException(
@@ -177,13 +187,7 @@ async def validate_token(request: ValidateTokenRequest):
             return ValidateTokenResponse(
                 valid=True,
                 message=message,
-                user=UserResponse(
-                    id=user_data["id"],
-                    email=user_data["email"],
-                    first_name=user_data["first_name"],
-                    last_name=user_data["last_name"],
-                    created_at=user_data["created_at"]
-                )
+                user=_user_response(user_data)
             )
         else:
             raise HTTPException(
@@ -230,13 +234,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
             return MeResponse(
                 success=True,
                 message="User details retrieved successfully",
-                user=UserResponse(
-                    id=user_data["id"],
-                    email=user_data["email"],
-                    first_name=user_data["first_name"],
-                    last_name=user_data["last_name"],
-                    created_at=user_data["created_at"]
-                )
+                user=_user_response(user_data)
             )
         else:
             raise HTTPException(
@@ -0,0 +1,62 @@
+import hashlib
+import time
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Annotated, Dict, Any
+from cachetools import TTLCache
+from services.authentication import auth_service
+
+security = HTTPBearer()
+
+# Authenticated users (with their token's expiry) keyed by a digest of their
+# bearer token, so repeated requests with the same token skip JWT verification
+# for a short window. Hits past the token's own expiry are never served.
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+def _token_key(token: str) -> bytes:
+    """Digest a token for use as a cache key without retaining the raw token."""
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+# Dependency for authentication
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    """
+    Dependency to authenticate user and return user data.
+    
+    Args:
+        credentials: Bearer token from Authorization header
+        
+    Returns:
+        Dict containing user data
+        
+    Raises:
+        HTTPException: 401 if authentication fails
+    """
+    cache_key = _token_key(credentials.credentials)
+    cached = _user_cache.get(cache_key)
+    if cached is not None:
+        cached_user, expires_at = cached
+        if expires_at > time.time():
+            return cached_user
+        _user_cache.pop(cache_key, None)
+    
+    try:
+        authenticated, message, user_data, expires_at = auth_service.verify_bearer_token_with_expiry(credentials.credentials)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token",
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from None
+    
+    if not authenticated or not user_data:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=message or "Authentication failed",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    _user_cache[cache_key] = (user_data, expires_at)
+    return user_data
+
+# Module-level alias so routes share one dependency declaration
+CurrentUser = Annotated[Dict[str, Any], Depends(get_current_user)]
@@ -1,12 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, HTTPException, status, Query
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from services.authentication import auth_service
+from typing import List, Optional
 from services.search_history import search_history_service
+from .deps import CurrentUser
 
 router = APIRouter(prefix="/api/search", tags=["search"])
-security = HTTPBearer()
 
 # Response models
 class SearchHistoryEntry(BaseModel):
@@ -24,53 +22,19 @@ class DeleteResponse(BaseModel):
     success: bool
     message: str
 
-# Dependency for authentication
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    """
-    Dependency to authenticate user and return user data.
-    
-    Args:
-        credentials: Bearer token from Authorization header
-        
-    Returns:
-        Dict containing user data
-        
-    Raises:
-        HTTPException: 401 if authentication fails
-    """
-    try:
-        authenticated, message, user_data = auth_service.isAuth({
-            "Authorization": f"Bearer {credentials.credentials}"
-        })
-        
-        if authenticated and user_data:
-            return user_data
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=message or "Authentication failed",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
 @router.get("/history", response_model=SearchHistoryResponse)
 async def get_search_history(
+    current_user: CurrentUser,
     offset: int = Query(0, ge=0, description="Number of entries to skip"),
-    limit: int = Query(30, ge=0, le=100, description="Maximum number of entries to return (0 for no limit)"),
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    limit: int = Query(30, ge=0, le=100, description="Maximum number of entries to return (0 for no limit)")
 ):
     """
     Get the authenticated user's search history with pagination.
     
     Args:
+        current_user: Authenticated user data (from dependency)
         offset: Number of entries to skip (for pagination)
         limit: Maximum number of entries to return (0 for no limit, max 100)
-        current_user: Authenticated user data (from dependency)
         
     Returns:
         SearchHistoryResponse with paginated search history
@@ -90,13 +54,8 @@ async def get_search_history(
             limit=limit
         )
         
-        # Get total count for pagination info (using limit=0 to get all)
-        total_history = search_history_service.get_user_search_history(
-            user_id=user_id,
-            offset=0,
-            limit=0
-        )
-        total_count = len(total_history)
+        # Get total count for pagination info
+        total_count = search_history_service.count_user_search_history(user_id)
         
         # Convert to response model
         history_entries = [
@@ -129,7 +88,7 @@ async def get_search_history(
 @router.delete("/{search_id}", response_model=DeleteResponse)
 async def delete_search_entry(
     search_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """
     Delete a specific search history entry.
@@ -181,7 +140,7 @@ async def delete_search_entry(
 
 @router.delete("/history", response_model=DeleteResponse)
 async def delete_all_search_history(
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """
     Delete all search history for the authenticated user.
@@ -1,64 +1,50 @@
-from fastapi import APIRouter, Query, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import List, Optional, Dict, Any
+import logging
+from fastapi import APIRouter, BackgroundTasks, Query, HTTPException, Response, status
+from pydantic import TypeAdapter
+from typing import List, Optional
 from models import Source
 from services.nasa_service import search_images
-from services.authentication import auth_service
 from services.search_history import search_history_service
+from .deps import CurrentUser
 
 router = APIRouter(prefix="/api", tags=["sources"])
-security = HTTPBearer()
+logger = logging.getLogger(__name__)
 
-# Dependency for authentication
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    """
-    Dependency to authenticate user and return user data.
-    
-    Args:
-        credentials: Bearer token from Authorization header
-        
-    Returns:
-        Dict containing user data
-        
-    Raises:
-        HTTPException: 401 if authentication fails
-    """
+# Validates the whole result list in a single pydantic-core call and encodes it
+# straight to JSON bytes, instead of FastAPI's per-item response_model pass.
+_SOURCES_ADAPTER = TypeAdapter(List[Source])
+
+async def _save_search_history(user_id: str, search_term: str) -> None:
+    """Record a search after the response is sent; failures never reach the client."""
     try:
-        authenticated, message, user_data = auth_service.isAuth({
-            "Authorization": f"Bearer {credentials.credentials}"
-        })
-        
-        if authenticated and user_data:
-            return user_data
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=message or "Authentication failed",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication token",
-            headers={"WWW-Authenticate": "Bearer"},
+        search_history_service.save_or_update_user_search(
+            user_id=user_id,
+            search_term=search_term
         )
+    except Exception as search_error:
+        # Log the error but don't fail the main request
+        logger.warning("Failed to save search history: %s", search_error)
 
-@router.get("/sources", response_model=List[Source])
+@router.get("/sources", response_model=None, responses={200: {"model": List[Source]}})
 async def get_sources(
+    background_tasks: BackgroundTasks,
+    current_user: CurrentUser,
     offset: int = 0,
     limit: Optional[int] = None,
     q: Optional[str] = Query(None, description="Search query for NASA images"),
-    current_user: Dict[str, Any] = Depends(get_current_user)
+    top_k: Optional[int] = Query(None, ge=1, description="Return only the best-scoring results of the page")
 ):
     """
     Get space images and sources from NASA with pagination support.
     Requires authentication. Tracks search history for authenticated user.
     
     Args:
+        background_tasks: Tasks run after the response is sent (search history save)
+        current_user: Authenticated user data (from dependency)
         offset: Number of items to skip (for pagination, default: 0)
         limit: Maximum number of items to return (default: 30)
         q: Search query for NASA images (optional)
-        current_user: Authenticated user data (from dependency)
+        top_k: Keep only this many best-scoring results of the page (optional, needs q)
         
     Returns:
         List of Source objects containing space images and metadata
@@ -77,22 +63,16 @@ async def get_sources(
         page = (max(offset, 0) // effective_limit) + 1
         
         # Get search results from NASA API
-        results = search_images(query=q, page=page, page_size=effective_limit)
+        results = await search_images(query=q, page=page, page_size=effective_limit, top_k=top_k)
         
-        # Track search history if there's a search query
+        # Track search history if there's a search query (after the response is sent)
         if q and q.strip():
-            try:
-                user_id = current_user["id"]
-                search_history_service.save_or_update_user_search(
-                    user_id=user_id,
-                    search_term=q.strip()
-                )
-            except Exception as search_error:
-                # Log the error but don't fail the main request
-                # In a production app, you'd want proper logging here
-                print(f"Failed to save search history: {search_error}")
+            background_tasks.add_task(_save_search_history, current_user["id"], q.strip())
         
-        return results
+        return Response(
+            content=_SOURCES_ADAPTER.dump_json(_SOURCES_ADAPTER.validate_python(results)),
+            media_type="application/json"
+        )
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions (like NASA API errors)
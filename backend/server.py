@@ -0,0 +1,28 @@
+"""
+Production entry point for the Space Explorer API.
+
+Runs the app under Uvicorn with the uvloop event loop and the httptools HTTP
+parser explicitly, instead of relying on whatever Uvicorn auto-detects.
+
+Usage:
+    python server.py
+"""
+
+import os
+
+import uvicorn
+
+from app import app
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8080"))
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        app,
+        host=HOST,
+        port=PORT,
+        loop="uvloop",
+        http="httptools",
+    )
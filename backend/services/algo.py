@@ -4,10 +4,10 @@ Algorithm service for text similarity and confidence scoring.
 This module implements TF-IDF based cosine similarity calculation to determine
 how relevant a description is to a given search term. It includes:
 
-- Text tokenization (simple whitespace-based)
+- Text tokenization (lowercased, punctuation-insensitive)
 - Term Frequency (TF) calculation
 - Inverse Document Frequency (IDF) calculation
-- TF-IDF vector computation
+- TF-IDF vector computation (optionally L2-normalized)
 - Cosine similarity calculation
 - Confidence scoring with term overlap weighting
 
@@ -18,56 +18,50 @@ Example usage:
     # Returns a score between 0.0 and 1.0
 """
 
-from typing import Dict, List, Set
+from collections import Counter
+from typing import Callable, Dict, List
 import math
+import string
+
+
+# Maps ASCII punctuation to spaces, so "Mars." and "Mars" tokenize the same
+_PUNCTUATION_TO_SPACE = str.maketrans(string.punctuation, " " * len(string.punctuation))
 
 
 def tokenize(text: str) -> List[str]:
-    """Simple tokenizer: lowercase and split by whitespace."""
-    return text.lower().split()
+    """Tokenizer: lowercase, treat ASCII punctuation as whitespace, and split."""
+    return text.lower().translate(_PUNCTUATION_TO_SPACE).split()
 
 
 def calculate_tf(tokens: List[str]) -> Dict[str, float]:
     """Calculate term frequency for a list of tokens."""
-    tf = {}
     total_tokens = len(tokens)
     
     if total_tokens == 0:
-        return tf
-    
-    for token in tokens:
-        tf[token] = tf.get(token, 0) + 1
+        return {}
     
-    # Normalize by total number of tokens
-    for token in tf:
-        tf[token] = tf[token] / total_tokens
-    
-    return tf
+    # Counter does the counting in C; normalize by total number of tokens
+    return {token: count / total_tokens for token, count in Counter(tokens).items()}
 
 
 def calculate_idf(documents_tokens: List[List[str]]) -> Dict[str, float]:
     """Calculate inverse document frequency for all unique tokens across documents."""
-    idf = {}
     total_documents = len(documents_tokens)
     
     if total_documents == 0:
-        return idf
+        return {}
     
-    # Get all unique tokens across all documents
-    all_tokens: Set[str] = set()
+    # Count how many documents contain each token, in a single pass
+    document_frequency: Counter = Counter()
     for doc_tokens in documents_tokens:
-        all_tokens.update(doc_tokens)
-    
-    # Calculate IDF for each token
-    for token in all_tokens:
-        # Count how many documents contain this token
-        docs_with_token = sum(1 for doc_tokens in documents_tokens if token in doc_tokens)
-        
-        # IDF = log(total_documents / docs_with_token)
-        # Add 1 to avoid division by zero
-        idf[token] = math.log(total_documents / (docs_with_token + 1))
+        document_frequency.update(set(doc_tokens))
     
-    return idf
+    # IDF = log(total_documents / docs_with_token)
+    # Add 1 to avoid division by zero
+    return {
+        token: math.log(total_documents / (docs_with_token + 1))
+        for token, docs_with_token in document_frequency.items()
+    }
 
 
 def calculate_tf_idf(tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
@@ -82,31 +76,41 @@ def calculate_tf_idf(tokens: List[str], idf: Dict[str, float]) -> Dict[str, floa
     return tf_idf
 
 
-def cosine_similarity(vector1: Dict[str, float], vector2: Dict[str, float]) -> float:
-    """Calculate cosine similarity between two TF-IDF vectors."""
-    # Get all unique terms from both vectors
-    all_terms = set(vector1.keys()) | set(vector2.keys())
+def l2_normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    """Scale a vector to unit length. A zero vector normalizes to an empty one."""
+    magnitude = math.sqrt(sum(val * val for val in vector.values()))
     
-    if not all_terms:
-        return 0.0
+    if magnitude == 0.0:
+        return {}
     
-    # Calculate dot product
-    dot_product = 0.0
-    for term in all_terms:
-        v1_val = vector1.get(term, 0.0)
-        v2_val = vector2.get(term, 0.0)
-        dot_product += v1_val * v2_val
+    return {term: val / magnitude for term, val in vector.items()}
+
+
+def calculate_tf_idf_normalized(tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
+    """Calculate an L2-normalized TF-IDF vector, so cosine similarity is a plain dot product."""
+    return l2_normalize(calculate_tf_idf(tokens, idf))
+
+
+def dot_product(vector1: Dict[str, float], vector2: Dict[str, float]) -> float:
+    """Calculate the dot product of two sparse vectors, iterating the shorter one."""
+    if len(vector1) > len(vector2):
+        vector1, vector2 = vector2, vector1
     
+    return sum(val * vector2.get(term, 0.0) for term, val in vector1.items())
+
+
+def cosine_similarity(vector1: Dict[str, float], vector2: Dict[str, float]) -> float:
+    """Calculate cosine similarity between two TF-IDF vectors."""
     # Calculate magnitudes
-    magnitude1 = math.sqrt(sum(val ** 2 for val in vector1.values()))
-    magnitude2 = math.sqrt(sum(val ** 2 for val in vector2.values()))
+    magnitude1 = math.sqrt(sum(val * val for val in vector1.values()))
+    magnitude2 = math.sqrt(sum(val * val for val in vector2.values()))
     
     # Avoid division by zero
     if magnitude1 == 0.0 or magnitude2 == 0.0:
         return 0.0
     
     # Cosine similarity = dot_product / (magnitude1 * magnitude2)
-    similarity = dot_product / (magnitude1 * magnitude2)
+    similarity = dot_product(vector1, vector2) / (magnitude1 * magnitude2)
     
     # Ensure result is between 0 and 1
     return max(0.0, min(1.0, similarity))
@@ -134,14 +138,15 @@ def confidence_score_tfidf(search_term: str, description: str) -> float:
     # Calculate IDF for the corpus
     idf = calculate_idf(corpus)
     
-    # Calculate TF-IDF vectors for both texts
-    search_tf_idf = calculate_tf_idf(search_tokens, idf)
-    description_tf_idf = calculate_tf_idf(description_tokens, idf)
+    # Calculate normalized TF-IDF vectors for both texts
+    search_tf_idf = calculate_tf_idf_normalized(search_tokens, idf)
+    description_tf_idf = calculate_tf_idf_normalized(description_tokens, idf)
     
-    # Calculate cosine similarity
-    similarity = cosine_similarity(search_tf_idf, description_tf_idf)
+    # Cosine similarity of unit vectors is their dot product
+    similarity = dot_product(search_tf_idf, description_tf_idf)
     
-    return similarity
+    # Ensure result is between 0 and 1
+    return max(0.0, min(1.0, similarity))
 
 
 def confidence_score(search_term: str, description: str) -> float:
@@ -168,39 +173,78 @@ def confidence_score(search_term: str, description: str) -> float:
     
     # For better discrimination, let's use a simpler approach:
     # Calculate overlap ratio with term frequency weighting
+    return _overlap_score(calculate_tf(search_tokens), len(search_tokens), description_tokens)
+
+
+def make_scorer(search_term: str) -> Callable[[str], float]:
+    """
+    Specialize confidence scoring on a fixed search term.
+    
+    The search term is tokenized and weighted once; the returned callable
+    scores a description exactly as confidence_score would.
+    
+    Args:
+        search_term: A short search query string
+    
+    Returns:
+        A function mapping a description to a confidence score between 0.0 and 1.0
+    """
+    search_tokens = tokenize(search_term)
+    if not search_tokens:
+        return lambda description: 0.0
     
-    # Get term frequencies
     search_tf = calculate_tf(search_tokens)
-    description_tf = calculate_tf(description_tokens)
+    search_length = len(search_tokens)
+    
+    def scorer(description: str) -> float:
+        return _overlap_score(search_tf, search_length, tokenize(description))
     
-    # Calculate weighted overlap
-    common_terms = set(search_tf.keys()) & set(description_tf.keys())
+    return scorer
+
+
+def _overlap_score(search_tf: Dict[str, float], search_length: int, description_tokens: List[str]) -> float:
+    """Score description tokens against a precomputed search TF vector."""
+    if not description_tokens:
+        return 0.0
     
-    if not common_terms:
+    if search_length == 1:
+        # Single-token query (the common case): search_tf is {term: 1.0} and
+        # coverage is 1, so the general formula below reduces to
+        # sqrt(term count / description length) - no TF dict needed.
+        (term,) = search_tf
+        term_count = description_tokens.count(term)
+        return math.sqrt(term_count / len(description_tokens)) if term_count else 0.0
+    
+    # Cheap early exit: with no shared term the score is 0, so skip building
+    # the description TF vector
+    if search_tf.keys().isdisjoint(description_tokens):
         return 0.0
     
-    # Calculate weighted similarity based on term importance
+    # Get term frequencies
+    description_tf = calculate_tf(description_tokens)
+    
+    # Calculate weighted similarity based on term importance, in a single
+    # pass over the (short) search vector
     search_weight = 0.0
     overlap_weight = 0.0
+    common_count = 0
     
-    for term in search_tf:
-        search_weight += search_tf[term]
-        if term in description_tf:
+    for term, search_value in search_tf.items():
+        search_weight += search_value
+        description_value = description_tf.get(term)
+        if description_value is not None:
             # Weight by geometric mean of frequencies
-            overlap_weight += math.sqrt(search_tf[term] * description_tf[term])
+            overlap_weight += math.sqrt(search_value * description_value)
+            common_count += 1
     
-    if search_weight == 0.0:
+    if common_count == 0 or search_weight == 0.0:
         return 0.0
     
     # Base similarity on overlap ratio
     base_similarity = overlap_weight / search_weight
     
-    # Apply length penalty for very short descriptions
-    description_length = len(description_tokens)
-    search_length = len(search_tokens)
-    
     # Bonus for having good coverage of search terms
-    coverage_ratio = len(common_terms) / len(search_tokens)
+    coverage_ratio = common_count / search_length
     
     # Final score combines base similarity with coverage
     final_score = base_similarity * (0.7 + 0.3 * coverage_ratio)
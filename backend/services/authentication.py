@@ -1,11 +1,33 @@
-import jwt
+import base64
 import bcrypt
+import hashlib
+import hmac
+import logging
+import orjson
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 from functools import wraps
+from cachetools import TTLCache
 from .db import db
 
+logger = logging.getLogger(__name__)
+
+
+def _b64url_encode(data: bytes) -> bytes:
+    """Unpadded base64url encoding, as used by JWT segments."""
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def _b64url_decode(segment: bytes) -> bytes:
+    """Decode an unpadded base64url JWT segment."""
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+# User fields that are safe to return to clients (never the password hash)
+_SAFE_FIELDS = ('id', 'email', 'first_name', 'last_name', 'created_at', 'updated_at', 'last_login')
+
 
 class AuthenticationService:
     """
@@ -18,12 +40,99 @@ class AuthenticationService:
         self.jwt_algorithm = 'HS256'
         self.jwt_expiration_hours = 24  # Token expires after 24 hours
         
+        # Fixed HS256 configuration, so the key and header segment are computed once
+        self._jwt_key = self.jwt_secret.encode('utf-8')
+        self._jwt_header_segment = _b64url_encode(orjson.dumps({'alg': self.jwt_algorithm, 'typ': 'JWT'}))
+        
+        # bcrypt work factor for new password hashes (existing hashes keep their own cost).
+        # For a memory-hard alternative, argon2-cffi's argon2id is a drop-in option.
+        self.bcrypt_rounds = int(os.getenv('BCRYPT_ROUNDS', '12'))
+        
+        # Recently verified logins, so repeat logins within the TTL skip bcrypt.
+        # Trade-off: a fast digest of the password is held in memory for that window;
+        # set LOGIN_VERIFY_CACHE_TTL=0 to disable.
+        verify_cache_ttl = int(os.getenv('LOGIN_VERIFY_CACHE_TTL', '60'))
+        self._verify_cache: Optional[TTLCache] = (
+            TTLCache(maxsize=1024, ttl=verify_cache_ttl) if verify_cache_ttl > 0 else None
+        )
+        
         # Ensure users collection exists
         db.createCollection("users")
+        
+        # Stored emails are canonical lowercase, so lookups never lowercase stored values
+        self._migrate_email_case()
+        
+        # Lowercased email -> user ID, so signup/login don't scan every user.
+        # Tagged with the users collection version it reflects (see db.version()).
+        self._email_index: Dict[str, str] = {}
+        self._email_index_version: Optional[int] = None
+        self._rebuild_email_index()
+    
+    def _migrate_email_case(self) -> None:
+        """One-time migration: lowercase any legacy mixed-case stored emails."""
+        for user in db.get("users"):
+            email = user.get('email', '')
+            if 'id' in user and email != email.lower():
+                db.update("users", user['id'], {'email': email.lower()}, upsert=False)
+    
+    def _rebuild_email_index(self) -> None:
+        """
+        Rebuild the email index from the users collection.
+        
+        Legacy accounts whose emails differ only by case collide once lowercased;
+        the first one keeps the email (as a front-to-back scan would find it) and
+        the collision is logged rather than switching logins to another account.
+        """
+        email_index: Dict[str, str] = {}
+        for user in db.get("users"):
+            if 'id' not in user:
+                continue
+            email = user.get('email', '')
+            first_id = email_index.setdefault(email, user['id'])
+            if first_id != user['id']:
+                logger.warning("Users %s and %s share email %r; logins use %s",
+                               first_id, user['id'], email, first_id)
+        self._email_index = email_index
+        self._email_index_version = db.version("users")
+    
+    def _after_users_write(self, version_before: int, saves: int = 1) -> None:
+        """
+        Bring the email index's version up to date after our own write to users.
+        
+        version_before is db.version("users") read just before the write, which saved
+        the collection `saves` times. The write may also have reloaded another worker's
+        changes from disk, so the version is only advanced if the index was current
+        before it and the version moved by our saves alone; otherwise it is rebuilt.
+        """
+        if (version_before == self._email_index_version
+                and db.version("users") == version_before + saves):
+            self._email_index_version = version_before + saves
+        else:
+            self._rebuild_email_index()
+    
+    def _find_user_id_by_email(self, email: str) -> Optional[str]:
+        """
+        Look up a user ID by email.
+        
+        On a miss the index is rebuilt only if the users collection changed since
+        it was built (e.g. a user added by a different worker), so unknown emails
+        don't cost a scan of every user.
+        """
+        email_key = email.lower()
+        user_id = self._email_index.get(email_key)
+        if user_id is None and db.version("users") != self._email_index_version:
+            self._rebuild_email_index()
+            user_id = self._email_index.get(email_key)
+        return user_id
+    
+    @staticmethod
+    def _project(user: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a client-safe copy of a user containing only allowlisted fields."""
+        return {field: user[field] for field in _SAFE_FIELDS if field in user}
     
     def _hash_password(self, password: str) -> str:
         """Hash a password using bcrypt."""
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=self.bcrypt_rounds)
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed.decode('utf-8')
     
@@ -31,25 +140,85 @@ class AuthenticationService:
         """Verify a password against its hash."""
         return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
     
+    def _verify_login_password(self, user: Dict[str, Any], password: str) -> bool:
+        """
+        Verify a login password, reusing recent successful verifications.
+        
+        The cache key covers the stored hash, so a password change invalidates it.
+        Failed attempts are never cached and always pay the full bcrypt cost.
+        """
+        if self._verify_cache is None:
+            return self._verify_password(password, user['password'])
+        
+        cache_key = hashlib.sha256(
+            '\0'.join((user['id'], user['password'], password)).encode('utf-8')
+        ).hexdigest()
+        if cache_key in self._verify_cache:
+            return True
+        
+        if not self._verify_password(password, user['password']):
+            return False
+        
+        self._verify_cache[cache_key] = True
+        return True
+    
     def _generate_token(self, user_id: str, email: str) -> str:
         """Generate a JWT token for the user."""
+        # Integer epoch seconds, no datetime arithmetic
+        now = int(time.time())
         payload = {
             'user_id': user_id,
             'email': email,
-            'exp': datetime.utcnow() + timedelta(hours=self.jwt_expiration_hours),
-            'iat': datetime.utcnow()
+            'exp': now + self.jwt_expiration_hours * 3600,
+            'iat': now
         }
-        return jwt.encode(payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+        return self._encode_hs256(payload)
+    
+    def _sign(self, signing_input: bytes) -> bytes:
+        """Base64url HMAC-SHA256 signature of a JWT signing input."""
+        return _b64url_encode(hmac.new(self._jwt_key, signing_input, hashlib.sha256).digest())
+    
+    def _encode_hs256(self, payload: Dict[str, Any]) -> str:
+        """Encode a payload as an HS256-signed JWT."""
+        signing_input = self._jwt_header_segment + b'.' + _b64url_encode(orjson.dumps(payload))
+        return (signing_input + b'.' + self._sign(signing_input)).decode('ascii')
+    
+    def _decode_hs256(self, token: str) -> Dict[str, Any]:
+        """
+        Verify an HS256-signed JWT and return its payload.
+        
+        Raises:
+            ValueError: If the token is malformed, not HS256, badly signed or expired
+        """
+        signing_input, _, signature = token.encode('ascii').rpartition(b'.')
+        header_segment, _, payload_segment = signing_input.partition(b'.')
+        if not header_segment or not payload_segment or b'.' in payload_segment:
+            raise ValueError("Malformed token")
+        
+        # Constant-time comparison of the re-computed signature
+        if not hmac.compare_digest(self._sign(signing_input), signature):
+            raise ValueError("Invalid signature")
+        
+        header = orjson.loads(_b64url_decode(header_segment))
+        if not isinstance(header, dict) or header.get('alg') != self.jwt_algorithm:
+            raise ValueError("Unexpected token algorithm")
+        
+        payload = orjson.loads(_b64url_decode(payload_segment))
+        if not isinstance(payload, dict):
+            raise ValueError("Invalid token payload")
+        
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)) or exp <= time.time():
+            raise ValueError("Token expired")
+        
+        return payload
     
     def _decode_token(self, token: str) -> Optional[Dict[str, Any]]:
         """Decode and validate a JWT token."""
         try:
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
-            return payload
-        except jwt.ExpiredSignatureError:
-            return None  # Token expired
-        except jwt.InvalidTokenError:
-            return None  # Invalid token
+            return self._decode_hs256(token)
+        except ValueError:
+            return None  # Invalid or expired token
     
     def signup(self, email: str, password: str, first_name: str = "", last_name: str = "", **additional_fields) -> Tuple[bool, str, Optional[str], Optional[Dict[str, Any]]]:
         """
@@ -76,10 +245,9 @@ class AuthenticationService:
             return False, "Password must be at least 6 characters long", None, None
         
         # Check if user already exists
-        existing_users = db.get("users")
-        for user in existing_users:
-            if user.get('email', '').lower() == email.lower():
-                return False, "User with this email already exists", None, None
+        existing_id = self._find_user_id_by_email(email)
+        if existing_id and db.getOne("users", existing_id):
+            return False, "User with this email already exists", None, None
         
         # Hash password
         hashed_password = self._hash_password(password)
@@ -96,14 +264,16 @@ class AuthenticationService:
         
         # Save user to database
         try:
+            users_version = db.version("users")
             created_user = db.add("users", user_data)
+            self._email_index[created_user['email']] = created_user['id']
+            self._after_users_write(users_version)
             
             # Generate JWT token for the new user
             token = self._generate_token(created_user['id'], created_user['email'])
             
-            # Remove password from response
-            safe_user_data = created_user.copy()
-            safe_user_data.pop('password', None)
+            # Only return safe fields
+            safe_user_data = self._project(created_user)
             
             return True, "User created successfully", token, safe_user_data
             
@@ -126,18 +296,14 @@ class AuthenticationService:
             return False, "Email and password are required", None, None
         
         # Find user in database
-        users = db.get("users")
-        user = None
-        for u in users:
-            if u.get('email', '').lower() == email.lower():
-                user = u
-                break
+        user_id = self._find_user_id_by_email(email)
+        user = db.getOne("users", user_id) if user_id else None
         
         if not user:
             return False, "Invalid email or password", None, None
         
         # Verify password
-        if not self._verify_password(password, user['password']):
+        if not self._verify_login_password(user, password):
             return False, "Invalid email or password", None, None
         
         # Generate JWT token
@@ -145,13 +311,14 @@ class AuthenticationService:
             token = self._generate_token(user['id'], user['email'])
             
             # Update last login
+            users_version = db.version("users")
             db.update("users", user['id'], {
                 'last_login': datetime.utcnow().isoformat()
             })
+            self._after_users_write(users_version)
             
-            # Remove password from response
-            safe_user_data = user.copy()
-            safe_user_data.pop('password', None)
+            # Only return safe fields
+            safe_user_data = self._project(user)
             
             return True, "Login successful", token, safe_user_data
             
@@ -175,21 +342,51 @@ class AuthenticationService:
         if token.startswith('Bearer '):
             token = token[7:]
         
+        return self.verify_bearer_token(token)
+    
+    def verify_bearer_token(self, token: str) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+        """
+        Verify a raw JWT token (without the 'Bearer ' prefix) and return user data.
+        
+        Args:
+            token: JWT token as already extracted from the Authorization header
+            
+        Returns:
+            tuple: (valid: bool, message: str, user_data: dict or None)
+        """
+        valid, message, user_data, _ = self.verify_bearer_token_with_expiry(token)
+        return valid, message, user_data
+    
+    def verify_bearer_token_with_expiry(self, token: str) -> Tuple[bool, str, Optional[Dict[str, Any]], Optional[float]]:
+        """
+        Verify a raw JWT token like verify_bearer_token, also returning its expiry.
+        
+        Lets callers that cache the result bound it by the token's lifetime
+        without decoding the token a second time.
+        
+        Args:
+            token: JWT token as already extracted from the Authorization header
+            
+        Returns:
+            tuple: (valid: bool, message: str, user_data: dict or None, exp: epoch seconds or None)
+        """
+        if not token:
+            return False, "Token is required", None, None
+        
         # Decode token
         payload = self._decode_token(token)
         if not payload:
-            return False, "Invalid or expired token", None
+            return False, "Invalid or expired token", None, None
         
         # Get user from database to ensure they still exist
         user = db.getOne("users", payload['user_id'])
         if not user:
-            return False, "User not found", None
+            return False, "User not found", None, None
         
-        # Remove password from response
-        safe_user_data = user.copy()
-        safe_user_data.pop('password', None)
+        # Only return safe fields
+        safe_user_data = self._project(user)
         
-        return True, "Token is valid", safe_user_data
+        return True, "Token is valid", safe_user_data, payload['exp']
     
     def isAuth(self, request_headers: Dict[str, str]) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
         """
@@ -222,9 +419,7 @@ class AuthenticationService:
         """
         user = db.getOne("users", user_id)
         if user:
-            safe_user_data = user.copy()
-            safe_user_data.pop('password', None)
-            return safe_user_data
+            return self._project(user)
         return None
     
     def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
@@ -250,13 +445,14 @@ class AuthenticationService:
         # Add updated timestamp
         safe_update_data['updated_at'] = datetime.utcnow().isoformat()
         
-        # Update user
+        # Update user (emails can't change here, so the index entries stay accurate)
+        users_version = db.version("users")
         updated_user = db.update("users", user_id, safe_update_data, upsert=False)
+        self._after_users_write(users_version, saves=1 if updated_user else 0)
         
         if updated_user:
-            # Remove password from response
-            safe_user_data = updated_user.copy()
-            safe_user_data.pop('password', None)
+            # Only return safe fields
+            safe_user_data = self._project(updated_user)
             return True, "User updated successfully", safe_user_data
         else:
             return False, "User not found", None
@@ -1,9 +1,15 @@
-import json
+import atexit
+import logging
+import orjson
 import os
+import tempfile
+import threading
 import uuid
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Set
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 
 class DatabaseService:
     """
@@ -23,6 +29,26 @@ class DatabaseService:
         if not DatabaseService._initialized:
             self.db_path = Path(__file__).parent.parent / "db"
             self.db_path.mkdir(exist_ok=True)
+            # Parsed collections, reused until the file's mtime changes
+            self._cache: Dict[str, List[Dict[str, Any]]] = {}
+            self._mtime: Dict[str, int] = {}
+            # Document ID -> position in the cached list, built lazily per collection
+            self._index: Dict[str, Dict[str, int]] = {}
+            # Bumped whenever a collection's cached contents change (see version())
+            self._versions: Dict[str, int] = {}
+            
+            # Saves write through to disk by default. DB_WRITE_DELAY > 0 enables
+            # write-behind: saves update the cache immediately and collections are
+            # written once per window, so bursts of writes cost one file write.
+            # Write-behind is for single-process deployments only: a dirty collection
+            # is served from the cache and then written over the file, so changes
+            # other worker processes make within the window are lost.
+            self.write_delay = float(os.getenv('DB_WRITE_DELAY', '0'))
+            self._dirty: Set[str] = set()
+            self._flush_timer: Optional[threading.Timer] = None
+            # Guards the cache against the background flush thread
+            self._lock = threading.RLock()
+            atexit.register(self.flush)
             DatabaseService._initialized = True
     
     def _get_collection_path(self, collection_name: str) -> Path:
@@ -30,39 +56,169 @@ class DatabaseService:
         return self.db_path / f"{collection_name}.json"
     
     def _load_collection(self, collection_name: str) -> List[Dict[str, Any]]:
-        """Load a collection from file. Returns empty list if file doesn't exist."""
-        collection_path = self._get_collection_path(collection_name)
-        if not collection_path.exists():
-            return []
+        """
+        Load a collection from file. Returns empty list if file doesn't exist.
         
-        try:
-            with open(collection_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if not isinstance(data, list):
-                    raise ValueError(f"Collection {collection_name} is not a valid array")
-                return data
-        except (json.JSONDecodeError, ValueError) as e:
-            raise ValueError(f"Error loading collection {collection_name}: {str(e)}")
+        The parsed list is cached and reused while the file's mtime is unchanged.
+        Collections with unflushed writes are always served from the cache.
+        """
+        with self._lock:
+            if collection_name in self._dirty:
+                return self._cache[collection_name]
+            
+            collection_path = self._get_collection_path(collection_name)
+            try:
+                mtime = collection_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                if self._mtime.pop(collection_name, None) is not None:
+                    self._cache.pop(collection_name, None)
+                    self._index.pop(collection_name, None)
+                    self._bump_version(collection_name)
+                return []
+            
+            if self._mtime.get(collection_name) == mtime:
+                return self._cache[collection_name]
+            
+            try:
+                with open(collection_path, 'rb') as f:
+                    data = orjson.loads(f.read())
+                    if not isinstance(data, list):
+                        raise ValueError(f"Collection {collection_name} is not a valid array")
+            except ValueError as e:  # includes orjson.JSONDecodeError
+                raise ValueError(f"Error loading collection {collection_name}: {str(e)}")
+            
+            self._cache[collection_name] = data
+            self._mtime[collection_name] = mtime
+            self._index.pop(collection_name, None)
+            self._bump_version(collection_name)
+            return data
+    
+    def _bump_version(self, collection_name: str) -> None:
+        """Record that a collection's contents changed."""
+        self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+    
+    def _get_index(self, collection_name: str, data: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Get the ID -> position map for a loaded collection, building it if needed.
+        
+        Callers that mutate the cached list in place must keep the map in step.
+        """
+        index = self._index.get(collection_name)
+        if index is None:
+            index = {}
+            for i, doc in enumerate(data):
+                # First occurrence wins, matching a front-to-back scan
+                if 'id' in doc:
+                    index.setdefault(doc['id'], i)
+            self._index[collection_name] = index
+        return index
     
     def _save_collection(self, collection_name: str, data: List[Dict[str, Any]]) -> None:
-        """Save a collection to file."""
+        """
+        Save a collection: refresh its cached copy and schedule the file write.
+        
+        With write-behind disabled the file is written before returning.
+        """
+        with self._lock:
+            if self._cache.get(collection_name) is not data:
+                # A different list replaces the cached one, so its index no longer applies
+                self._index.pop(collection_name, None)
+            self._cache[collection_name] = data
+            self._bump_version(collection_name)
+            
+            if self.write_delay <= 0:
+                self._write_collection(collection_name, data)
+                return
+            
+            self._dirty.add(collection_name)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.write_delay, self._flush_in_background)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def _flush_in_background(self) -> None:
+        """Timer callback: flush pending writes, logging rather than raising failures."""
+        try:
+            self.flush()
+        except ValueError as e:
+            logger.error("Background database flush failed: %s", e)
+    
+    def flush(self) -> None:
+        """
+        Write every collection with pending changes to disk now.
+        
+        Called automatically after each write-behind window and at interpreter
+        exit; call it explicitly at other consistency points (e.g. app shutdown).
+        
+        Raises:
+            ValueError: If any collection fails to save (the others are still written)
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            
+            errors = []
+            while self._dirty:
+                collection_name = self._dirty.pop()
+                try:
+                    self._write_collection(collection_name, self._cache[collection_name])
+                except ValueError as e:
+                    errors.append(e)
+            if errors:
+                raise errors[0]
+    
+    def _write_collection(self, collection_name: str, data: List[Dict[str, Any]]) -> None:
+        """
+        Write a collection to its file.
+        
+        Writes compact JSON to a uniquely named temp file, syncs it and atomically
+        replaces the collection, so neither a crash mid-write nor another process
+        saving the same collection can leave a truncated or interleaved file behind.
+        """
         collection_path = self._get_collection_path(collection_name)
         
+        tmp_path = None
         try:
-            with open(collection_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(dir=self.db_path, prefix=f"{collection_name}.", suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, collection_path)
         except Exception as e:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            # The cached list may already hold the unsaved change; reload from disk next time
+            self._cache.pop(collection_name, None)
+            self._mtime.pop(collection_name, None)
+            self._index.pop(collection_name, None)
+            self._bump_version(collection_name)
             raise ValueError(f"Error saving collection {collection_name}: {str(e)}")
+        
+        self._mtime[collection_name] = collection_path.stat().st_mtime_ns
     
-    def _generate_unique_id(self, collection_name: str) -> str:
-        """Generate a unique ID that doesn't exist in the collection."""
-        existing_data = self._load_collection(collection_name)
-        existing_ids = {doc.get('id') for doc in existing_data if 'id' in doc}
+    def version(self, collection: str) -> int:
+        """
+        Get a token that changes whenever a collection's contents change.
+        
+        Covers writes through this service and changes made on disk by other
+        processes, so callers can cache data derived from a collection and
+        rebuild it only when the version moves. Each save through this service
+        advances it by exactly one, so a caller that updates its derived data
+        for its own write can tell whether anything else changed alongside it.
         
-        while True:
-            new_id = str(uuid.uuid4())
-            if new_id not in existing_ids:
-                return new_id
+        Args:
+            collection: Name of the collection
+            
+        Returns:
+            int: The collection's current version
+        """
+        self._load_collection(collection)
+        return self._versions.get(collection, 0)
     
     def createCollection(self, name: str) -> bool:
         """
@@ -76,7 +232,7 @@ class DatabaseService:
         """
         collection_path = self._get_collection_path(name)
         
-        if collection_path.exists():
+        if name in self._dirty or collection_path.exists():
             return False
         
         self._save_collection(name, [])
@@ -96,14 +252,16 @@ class DatabaseService:
         # Ensure collection exists
         self.createCollection(collection)
         
-        # Generate unique ID
-        doc_with_id = doc.copy()
-        doc_with_id['id'] = self._generate_unique_id(collection)
-        
         # Load existing data
         data = self._load_collection(collection)
+        index = self._get_index(collection, data)
+        
+        # Generate unique ID (uuid4 collisions are negligible, so no existence check)
+        doc_with_id = doc.copy()
+        doc_with_id['id'] = str(uuid.uuid4())
         
         # Add new document
+        index[doc_with_id['id']] = len(data)
         data.append(doc_with_id)
         
         # Save back to file
@@ -123,16 +281,45 @@ class DatabaseService:
             bool: True if document was deleted, False if not found
         """
         data = self._load_collection(collection)
+        index = self._get_index(collection, data)
         
         # Find and remove the document
-        original_length = len(data)
-        data = [doc for doc in data if doc.get('id') != doc_id]
+        doc_index = index.pop(doc_id, None)
+        if doc_index is None:
+            return False
         
-        if len(data) < original_length:
-            self._save_collection(collection, data)
-            return True
+        del data[doc_index]
+        # Only documents after the removed one shift position
+        for i in range(doc_index, len(data)):
+            shifted_id = data[i].get('id')
+            if shifted_id is not None and index.get(shifted_id, i + 1) == i + 1:
+                index[shifted_id] = i
         
-        return False
+        self._save_collection(collection, data)
+        return True
+    
+    def delete_many(self, collection: str, doc_ids: Iterable[str]) -> int:
+        """
+        Delete several documents from a collection by ID, saving the file once.
+        
+        Args:
+            collection: Name of the collection
+            doc_ids: IDs of the documents to delete
+            
+        Returns:
+            int: Number of documents deleted (IDs not found are ignored)
+        """
+        data = self._load_collection(collection)
+        doc_ids = set(doc_ids)
+        
+        # Filter the collection in a single pass
+        remaining = [doc for doc in data if doc.get('id') not in doc_ids]
+        deleted_count = len(data) - len(remaining)
+        
+        if deleted_count:
+            self._save_collection(collection, remaining)
+        
+        return deleted_count
     
     def update(self, collection: str, doc_id: str, new_payload: Dict[str, Any], upsert: bool = True) -> Optional[Dict[str, Any]]:
         """
@@ -148,13 +335,10 @@ class DatabaseService:
             dict: Updated document, or None if document not found and upsert=False
         """
         data = self._load_collection(collection)
+        index = self._get_index(collection, data)
         
         # Find the document to update
-        doc_index = None
-        for i, doc in enumerate(data):
-            if doc.get('id') == doc_id:
-                doc_index = i
-                break
+        doc_index = index.get(doc_id)
         
         if doc_index is not None:
             # Update existing document (merge fields)
@@ -171,6 +355,7 @@ class DatabaseService:
             # Create new document if not found and upsert is True
             new_doc = new_payload.copy()
             new_doc['id'] = doc_id
+            index[doc_id] = len(data)
             data.append(new_doc)
             
             self._save_collection(collection, data)
@@ -188,7 +373,8 @@ class DatabaseService:
         Returns:
             list: All documents in the collection
         """
-        return self._load_collection(collection)
+        # Copy so callers can't mutate the cached list
+        return list(self._load_collection(collection))
     
     def getOne(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -203,11 +389,8 @@ class DatabaseService:
         """
         data = self._load_collection(collection)
         
-        for doc in data:
-            if doc.get('id') == doc_id:
-                return doc
-        
-        return None
+        doc_index = self._get_index(collection, data).get(doc_id)
+        return data[doc_index] if doc_index is not None else None
 
 
 # Create singleton instance
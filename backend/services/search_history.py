@@ -1,7 +1,58 @@
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+import os
+import threading
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+from functools import wraps
+from itertools import islice
+from operator import itemgetter
+from types import MappingProxyType
+from typing import Deque, Dict, List, Any, Mapping, Optional, Set, Tuple
+from cachetools import LRUCache
 from .db import db
 
+# Shared read-only defaults for index lookups of users with no history, so
+# misses don't allocate a fresh empty container per call
+_EMPTY_IDS: Tuple[str, ...] = ()
+_EMPTY_MAP: Mapping[str, Any] = MappingProxyType({})
+
+# Default page size of get_user_search_history (the history view's first request)
+_DEFAULT_PAGE_SIZE = 30
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _epoch_us(moment: datetime) -> int:
+    """Convert a naive UTC datetime to integer microseconds since the Unix epoch."""
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def _timestamp_us(entry: Dict[str, Any]) -> int:
+    """Integer sort key for an entry's timestamp."""
+    timestamp_us = entry.get("timestamp_us")
+    if timestamp_us is None:
+        # Entries saved before timestamp_us was stored only have the ISO string
+        try:
+            timestamp_us = _epoch_us(datetime.fromisoformat(entry.get("timestamp", "")))
+        except (TypeError, ValueError):
+            timestamp_us = 0
+    return timestamp_us
+
+
+def _synchronized(method):
+    """Run a SearchHistoryService method while holding the service's lock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _trigrams(text: str) -> Set[str]:
+    """All 3-character substrings of a text (empty for texts shorter than 3)."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
 
 class SearchHistoryService:
     """
@@ -15,17 +66,46 @@ class SearchHistoryService:
         
         # Ensure the search history collection exists
         db.createCollection(self.collection_name)
+        
+        # Maximum entries kept per user; the oldest are evicted on save (0 disables the cap)
+        self.max_history_per_user = int(os.getenv('SEARCH_HISTORY_MAX_PER_USER', '1000'))
+        
+        # Guards the indexes, which are rebuilt and updated as several related dicts.
+        # Reentrant because public methods call each other.
+        self._lock = threading.RLock()
+        
+        # Entry ID -> entry and user ID -> entry IDs, so per-user reads don't scan
+        # every user's history. Built lazily and rebuilt when the collection changes
+        # outside this service (e.g. another worker process).
+        # Each user's IDs are kept oldest-to-newest by timestamp, so reads never sort.
+        self._entries_by_id: Dict[str, Dict[str, Any]] = {}
+        self._user_index: Dict[str, Deque[str]] = {}
+        # User ID -> lowercased term -> ID of the newest entry with that term
+        self._term_to_id: Dict[str, Dict[str, str]] = {}
+        # Lowercased term -> number of entries across all users
+        self._global_term_counts: Counter = Counter()
+        # User ID -> trigram of a lowercased term -> IDs of entries containing it
+        self._trigrams: Dict[str, Dict[str, Set[str]]] = {}
+        self._indexed_version: Optional[int] = None
+        # User ID -> default first page of their history, dropped on any change for that user
+        self._first_page_cache: LRUCache = LRUCache(maxsize=1024)
     
-    def save_user_search(self, user_id: str, search_term: str) -> Dict[str, Any]:
+    @staticmethod
+    def _term_key(entry: Dict[str, Any]) -> str:
+        """Case-insensitive key used to detect duplicate search terms."""
+        term_key = entry.get("search_term_lower")
+        if term_key is None:
+            # Entries saved before search_term_lower was stored
+            term_key = entry.get("search_term", "").strip().lower()
+        return term_key
+    
+    @staticmethod
+    def _normalize(user_id: str, search_term: str) -> Tuple[str, str]:
         """
-        Save a user's search term to their search history.
+        Validate a save request and derive the stored forms of its search term.
         
-        Args:
-            user_id: The ID of the user performing the search
-            search_term: The search term being saved
-            
         Returns:
-            dict: The saved search history entry with generated ID and timestamp
+            tuple: (stripped search term, lowercased search term)
         """
         if not user_id or not search_term:
             raise ValueError("user_id and search_term are required")
@@ -35,19 +115,196 @@ class SearchHistoryService:
         if not search_term:
             raise ValueError("search_term cannot be empty")
         
-        # Create search history entry
+        return search_term, search_term.lower()
+    
+    def _add_entry(self, user_id: str, search_term: str, search_term_lower: str, now: datetime) -> Dict[str, Any]:
+        """Create, index and return a new search history entry (index must be current)."""
+        current_time = now.isoformat()
         search_entry = {
             "user_id": user_id,
             "search_term": search_term,
-            "timestamp": datetime.utcnow().isoformat(),
-            "created_at": datetime.utcnow().isoformat()
+            "search_term_lower": search_term_lower,
+            "timestamp": current_time,
+            "timestamp_us": _epoch_us(now),
+            "created_at": current_time
         }
         
         # Save to database
+        version_before = db.version(self.collection_name)
         saved_entry = db.add(self.collection_name, search_entry)
-        
+        self._index_entry(saved_entry)
+        self._after_write(version_before)
+        self._evict_oldest(user_id)
         return saved_entry
     
+    def _ensure_index(self) -> None:
+        """Build the in-memory indexes if missing or stale."""
+        version = db.version(self.collection_name)
+        if version == self._indexed_version:
+            return
+        
+        entries = [
+            entry for entry in db.get(self.collection_name)
+            if "id" in entry and "user_id" in entry
+        ]
+        
+        # One sort at build time (integer keys); afterwards insertion order is timestamp order
+        try:
+            entries.sort(key=itemgetter("timestamp_us"))
+        except KeyError:
+            # Some entries predate timestamp_us; derive their keys from the ISO timestamp
+            entries.sort(key=_timestamp_us)
+        
+        # Extract columns once with C-level map/itemgetter, then bucket in a single pass
+        entry_ids = list(map(itemgetter("id"), entries))
+        user_ids = list(map(itemgetter("user_id"), entries))
+        term_keys = list(map(self._term_key, entries))
+        
+        # Counted oldest first, so equal counts rank by first use
+        self._global_term_counts = Counter(filter(None, term_keys))
+        self._entries_by_id = dict(zip(entry_ids, entries))
+        
+        user_index: Dict[str, Deque[str]] = defaultdict(deque)
+        term_to_id: Dict[str, Dict[str, str]] = defaultdict(dict)
+        trigrams: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        # Many entries share a term, so split each distinct term into trigrams once
+        term_trigrams: Dict[str, Set[str]] = {}
+        for entry_id, user_id, term_key in zip(entry_ids, user_ids, term_keys):
+            user_index[user_id].append(entry_id)
+            # Oldest to newest, so the newest entry for a term wins
+            term_to_id[user_id][term_key] = entry_id
+            grams = term_trigrams.get(term_key)
+            if grams is None:
+                grams = term_trigrams[term_key] = _trigrams(term_key)
+            user_trigrams = trigrams[user_id]
+            for trigram in grams:
+                user_trigrams[trigram].add(entry_id)
+        
+        # Plain dicts from here on, so lookups of missing keys never insert
+        self._user_index = dict(user_index)
+        self._term_to_id = dict(term_to_id)
+        self._trigrams = {user_id: dict(postings) for user_id, postings in trigrams.items()}
+        self._first_page_cache.clear()
+        self._indexed_version = version
+    
+    def _after_write(self, version_before: int, saves: int = 1) -> None:
+        """
+        Mark the indexes current after our own write, if nothing else changed.
+        
+        version_before is db.version() read just before the write, which saved the
+        collection `saves` times. The write may also have reloaded another worker's
+        entries from disk; those were never indexed, so unless the indexes were
+        current before and the version moved only by our saves, it is left stale
+        and _ensure_index rebuilds.
+        """
+        if (version_before == self._indexed_version
+                and db.version(self.collection_name) == version_before + saves):
+            self._indexed_version = version_before + saves
+    
+    def _index_entry(self, entry: Dict[str, Any]) -> None:
+        """Add or refresh a just-written entry in the indexes, as the user's newest."""
+        term_key = self._term_key(entry)
+        user_ids = self._user_index.setdefault(entry["user_id"], deque())
+        if entry["id"] in self._entries_by_id:
+            # Re-saved with a fresh timestamp: move it to the newest end
+            user_ids.remove(entry["id"])
+        else:
+            # A new entry; re-saves keep their term, so counts and trigrams stay as they are
+            if term_key:
+                self._global_term_counts[term_key] += 1
+            user_trigrams = self._trigrams.setdefault(entry["user_id"], {})
+            for trigram in _trigrams(term_key):
+                user_trigrams.setdefault(trigram, set()).add(entry["id"])
+        user_ids.append(entry["id"])
+        self._entries_by_id[entry["id"]] = entry
+        self._term_to_id.setdefault(entry["user_id"], {})[term_key] = entry["id"]
+        self._first_page_cache.pop(entry["user_id"], None)
+    
+    def _unindex_entry(self, entry: Dict[str, Any]) -> None:
+        """Remove a just-deleted entry from the indexes."""
+        self._entries_by_id.pop(entry["id"], None)
+        user_ids = self._user_index.get(entry["user_id"])
+        if user_ids is not None:
+            user_ids.remove(entry["id"])
+            if not user_ids:
+                del self._user_index[entry["user_id"]]
+                self._term_to_id.pop(entry["user_id"], None)
+                self._trigrams.pop(entry["user_id"], None)
+        
+        term_ids = self._term_to_id.get(entry["user_id"])
+        term_key = self._term_key(entry)
+        self._decrement_term_count(term_key)
+        
+        user_trigrams = self._trigrams.get(entry["user_id"])
+        if user_trigrams is not None:
+            for trigram in _trigrams(term_key):
+                posting = user_trigrams.get(trigram)
+                if posting is not None:
+                    posting.discard(entry["id"])
+                    if not posting:
+                        del user_trigrams[trigram]
+        
+        if term_ids is not None and term_ids.get(term_key) == entry["id"]:
+            del term_ids[term_key]
+            # Fall back to the next newest entry with the same term, if any
+            for entry_id in reversed(user_ids):
+                if self._term_key(self._entries_by_id[entry_id]) == term_key:
+                    term_ids[term_key] = entry_id
+                    break
+        self._first_page_cache.pop(entry["user_id"], None)
+    
+    def _unindex_user(self, user_id: str) -> None:
+        """Remove all of a user's just-deleted entries from the indexes in one pass."""
+        for entry_id in self._user_index.pop(user_id, ()):
+            entry = self._entries_by_id.pop(entry_id, None)
+            if entry is not None:
+                self._decrement_term_count(self._term_key(entry))
+        self._term_to_id.pop(user_id, None)
+        self._trigrams.pop(user_id, None)
+        self._first_page_cache.pop(user_id, None)
+    
+    def _evict_oldest(self, user_id: str) -> None:
+        """Delete a user's oldest entries beyond the per-user history cap."""
+        user_ids = self._user_index.get(user_id, _EMPTY_IDS)
+        excess = len(user_ids) - self.max_history_per_user
+        if self.max_history_per_user <= 0 or excess <= 0:
+            return
+        
+        evicted = [self._entries_by_id[entry_id] for entry_id in islice(user_ids, excess)]
+        for entry in evicted:
+            # Usually a single entry; db.delete keeps the collection's ID index, where
+            # delete_many's rebuilt list would make the next save rebuild it
+            version_before = db.version(self.collection_name)
+            db.delete(self.collection_name, entry["id"])
+            # Oldest first, so each removal is at the left end of the deque
+            self._unindex_entry(entry)
+            self._after_write(version_before)
+    
+    def _decrement_term_count(self, term_key: str) -> None:
+        """Drop one use of a term from the global counts."""
+        if term_key:
+            self._global_term_counts[term_key] -= 1
+            if self._global_term_counts[term_key] <= 0:
+                del self._global_term_counts[term_key]
+    
+    @_synchronized
+    def save_user_search(self, user_id: str, search_term: str) -> Dict[str, Any]:
+        """
+        Save a user's search term to their search history.
+        
+        Args:
+            user_id: The ID of the user performing the search
+            search_term: The search term being saved
+            
+        Returns:
+            dict: The saved search history entry with generated ID and timestamp
+        """
+        search_term, search_term_lower = self._normalize(user_id, search_term)
+        
+        self._ensure_index()
+        return self._add_entry(user_id, search_term, search_term_lower, datetime.utcnow())
+    
+    @_synchronized
     def save_or_update_user_search(self, user_id: str, search_term: str) -> Dict[str, Any]:
         """
         Save a user's search term to their search history, or update the timestamp if it already exists.
@@ -60,45 +317,32 @@ class SearchHistoryService:
         Returns:
             dict: The saved or updated search history entry with ID and timestamp
         """
-        if not user_id or not search_term:
-            raise ValueError("user_id and search_term are required")
-        
-        # Clean up the search term
-        search_term = search_term.strip()
-        if not search_term:
-            raise ValueError("search_term cannot be empty")
+        search_term, search_term_lower = self._normalize(user_id, search_term)
         
         # Check if this search term already exists for this user
-        user_history = self.get_user_search_history(user_id, offset=0, limit=0)
-        existing_entry = None
-        
-        for entry in user_history:
-            if entry.get("search_term", "").strip().lower() == search_term.lower():
-                existing_entry = entry
-                break
+        self._ensure_index()
+        existing_id = self._term_to_id.get(user_id, _EMPTY_MAP).get(search_term_lower)
         
-        current_time = datetime.utcnow().isoformat()
+        # One clock read, so all timestamps match
+        now = datetime.utcnow()
         
-        if existing_entry:
+        if existing_id:
             # Update the existing entry's timestamp
-            updated_entry = db.update(self.collection_name, existing_entry["id"], {
+            current_time = now.isoformat()
+            version_before = db.version(self.collection_name)
+            updated_entry = db.update(self.collection_name, existing_id, {
                 "timestamp": current_time,
+                "timestamp_us": _epoch_us(now),
                 "updated_at": current_time
             })
+            self._index_entry(updated_entry)
+            self._after_write(version_before)
             return updated_entry
         else:
             # Create new search history entry
-            search_entry = {
-                "user_id": user_id,
-                "search_term": search_term,
-                "timestamp": current_time,
-                "created_at": current_time
-            }
-            
-            # Save to database
-            saved_entry = db.add(self.collection_name, search_entry)
-            return saved_entry
+            return self._add_entry(user_id, search_term, search_term_lower, now)
     
+    @_synchronized
     def get_user_search_history(self, user_id: str, offset: Optional[int] = 0, limit: Optional[int] = 30) -> List[Dict[str, Any]]:
         """
         Retrieve a user's search history with pagination, ordered by most recent first.
@@ -125,40 +369,49 @@ class SearchHistoryService:
         if offset is None:
             offset = 0
         if limit is None:
-            limit = 30
-        
-        # Get all search history
-        all_history = db.get(self.collection_name)
-        
-        # Filter by user_id
-        user_history = [
-            entry for entry in all_history 
-            if entry.get("user_id") == user_id
+            limit = _DEFAULT_PAGE_SIZE
+        
+        self._ensure_index()
+        is_first_page = offset == 0 and limit == _DEFAULT_PAGE_SIZE
+        if is_first_page:
+            cached_page = self._first_page_cache.get(user_id)
+            if cached_page is not None:
+                return list(cached_page)
+        
+        # Get this user's entries from the index, already in timestamp order
+        newest_first = reversed(self._user_index.get(user_id, _EMPTY_IDS))
+        
+        # Apply pagination (offset and limit); limit 0 returns all entries from offset onwards
+        end_index = offset + limit if limit > 0 else None
+        page = [
+            self._entries_by_id[entry_id]
+            for entry_id in islice(newest_first, offset, end_index)
         ]
         
-        # Sort by timestamp (newest first)
-        user_history.sort(
-            key=lambda x: x.get("timestamp", ""), 
-            reverse=True
-        )
-        
-        # Apply pagination (offset and limit)
-        if limit > 0:
-            # Normal pagination with both offset and limit
-            start_index = offset
-            end_index = offset + limit
-            user_history = user_history[start_index:end_index]
-        elif limit == 0:
-            # If limit is 0, return all entries from offset onwards
-            if offset > 0:
-                user_history = user_history[offset:]
-            # If both offset and limit are 0, return all entries (no slicing needed)
-        else:
-            # This shouldn't happen due to validation, but handle negative limit
-            user_history = []
+        if is_first_page:
+            # Callers get their own list, so the cached one is never mutated
+            self._first_page_cache[user_id] = page
+            return list(page)
+        return page
+    
+    @_synchronized
+    def count_user_search_history(self, user_id: str) -> int:
+        """
+        Count a user's search history entries without materializing or sorting them.
         
-        return user_history
+        Args:
+            user_id: The ID of the user whose search history to count
+            
+        Returns:
+            int: Total number of search history entries for the user
+        """
+        if not user_id:
+            raise ValueError("user_id is required")
+        
+        self._ensure_index()
+        return len(self._user_index.get(user_id, _EMPTY_IDS))
     
+    @_synchronized
     def delete_user_search(self, user_id: str, search_id: str) -> bool:
         """
         Delete a specific search entry for a user.
@@ -174,7 +427,8 @@ class SearchHistoryService:
             raise ValueError("user_id and search_id are required")
         
         # First, verify the search entry exists and belongs to the user
-        search_entry = db.getOne(self.collection_name, search_id)
+        self._ensure_index()
+        search_entry = self._entries_by_id.get(search_id)
         
         if not search_entry:
             return False  # Search entry not found
@@ -183,8 +437,14 @@ class SearchHistoryService:
             return False  # Search entry doesn't belong to this user
         
         # Delete the search entry
-        return db.delete(self.collection_name, search_id)
+        version_before = db.version(self.collection_name)
+        deleted = db.delete(self.collection_name, search_id)
+        if deleted:
+            self._unindex_entry(search_entry)
+            self._after_write(version_before)
+        return deleted
     
+    @_synchronized
     def delete_all_user_search_history(self, user_id: str) -> int:
         """
         Delete all search history entries for a specific user.
@@ -198,17 +458,18 @@ class SearchHistoryService:
         if not user_id:
             raise ValueError("user_id is required")
         
-        # Get all search history for the user (no pagination for deletion)
-        user_history = self.get_user_search_history(user_id, offset=0, limit=0)
+        # The user's entry IDs straight from the index (no history fetch or ordering needed)
+        self._ensure_index()
         
-        # Delete each entry
-        deleted_count = 0
-        for entry in user_history:
-            if db.delete(self.collection_name, entry["id"]):
-                deleted_count += 1
+        # Delete them all with a single collection write
+        version_before = db.version(self.collection_name)
+        deleted_count = db.delete_many(self.collection_name, self._user_index.get(user_id, _EMPTY_IDS))
         
+        self._unindex_user(user_id)
+        self._after_write(version_before, saves=1 if deleted_count else 0)
         return deleted_count
     
+    @_synchronized
     def get_user_unique_search_terms(self, user_id: str, limit: Optional[int] = None) -> List[str]:
         """
         Get unique search terms for a user (useful for search suggestions).
@@ -223,25 +484,25 @@ class SearchHistoryService:
         if not user_id:
             raise ValueError("user_id is required")
         
-        # Get user's search history (all entries for unique terms)
-        user_history = self.get_user_search_history(user_id, offset=0, limit=0)
+        self._ensure_index()
+        max_terms = limit if limit is not None and limit > 0 else None
         
-        # Extract unique search terms while preserving order
+        # Extract unique search terms newest first, stopping once the limit is reached
         seen = set()
         unique_terms = []
         
-        for entry in user_history:
-            search_term = entry.get("search_term", "").strip()
-            if search_term and search_term.lower() not in seen:
-                seen.add(search_term.lower())
-                unique_terms.append(search_term)
-        
-        # Apply limit if specified
-        if limit is not None and limit > 0:
-            unique_terms = unique_terms[:limit]
+        for entry_id in reversed(self._user_index.get(user_id, _EMPTY_IDS)):
+            entry = self._entries_by_id[entry_id]
+            term_key = self._term_key(entry)
+            if term_key and term_key not in seen:
+                seen.add(term_key)
+                unique_terms.append(entry.get("search_term", "").strip())
+                if len(unique_terms) == max_terms:
+                    break
         
         return unique_terms
     
+    @_synchronized
     def search_user_history(self, user_id: str, query: str) -> List[Dict[str, Any]]:
         """
         Search through a user's search history for entries containing a specific query.
@@ -256,18 +517,33 @@ class SearchHistoryService:
         if not user_id or not query:
             raise ValueError("user_id and query are required")
         
-        # Get user's search history (all entries for searching)
-        user_history = self.get_user_search_history(user_id, offset=0, limit=0)
-        
-        # Filter entries that contain the query (case-insensitive)
+        self._ensure_index()
         query_lower = query.lower()
-        matching_entries = [
-            entry for entry in user_history
-            if query_lower in entry.get("search_term", "").lower()
-        ]
+        
+        # Narrow to entries containing every trigram of the query; queries shorter
+        # than 3 characters have none and are checked against all entries
+        candidates: Optional[Set[str]] = None
+        user_trigrams = self._trigrams.get(user_id, _EMPTY_MAP)
+        for trigram in sorted(_trigrams(query_lower), key=lambda t: len(user_trigrams.get(t, _EMPTY_IDS))):
+            posting = user_trigrams.get(trigram)
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        
+        # Verify the substring match (case-insensitive), newest first
+        matching_entries = []
+        for entry_id in reversed(self._user_index.get(user_id, _EMPTY_IDS)):
+            if candidates is not None and entry_id not in candidates:
+                continue
+            entry = self._entries_by_id[entry_id]
+            if query_lower in self._term_key(entry):
+                matching_entries.append(entry)
         
         return matching_entries
     
+    @_synchronized
     def get_popular_search_terms(self, limit: Optional[int] = 10) -> List[Dict[str, Any]]:
         """
         Get the most popular search terms across all users.
@@ -278,27 +554,15 @@ class SearchHistoryService:
         Returns:
             list: List of dictionaries with 'search_term' and 'count' keys, ordered by frequency
         """
-        # Get all search history
-        all_history = db.get(self.collection_name)
-        
-        # Count search term frequency
-        term_counts = {}
-        for entry in all_history:
-            search_term = entry.get("search_term", "").strip().lower()
-            if search_term:
-                term_counts[search_term] = term_counts.get(search_term, 0) + 1
-        
-        # Sort by count (descending) and convert to list of dicts
-        popular_terms = [
+        # Term counts are maintained incrementally by the index
+        self._ensure_index()
+        
+        # most_common selects the top entries with a heap when limited
+        top_n = limit if limit is not None and limit > 0 else None
+        return [
             {"search_term": term, "count": count}
-            for term, count in sorted(term_counts.items(), key=lambda x: x[1], reverse=True)
+            for term, count in self._global_term_counts.most_common(top_n)
         ]
-        
-        # Apply limit
-        if limit is not None and limit > 0:
-            popular_terms = popular_terms[:limit]
-        
-        return popular_terms
 
 
 # Create singleton instance
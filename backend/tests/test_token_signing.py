@@ -0,0 +1,92 @@
+"""
+Check the hand-written HS256 signing in the auth service against PyJWT.
+
+PyJWT is the reference implementation: tokens must round-trip between the two
+in both directions, and every token PyJWT rejects must be rejected here too.
+"""
+import json
+import time
+
+import jwt
+import pytest
+
+from services.authentication import _b64url_encode, auth_service
+
+
+SECRET = auth_service.jwt_secret
+
+
+def _payload(exp_offset: int = 3600):
+    now = int(time.time())
+    return {'user_id': 'user-1', 'email': 'user@example.com', 'iat': now, 'exp': now + exp_offset}
+
+
+def _assert_both_reject(token: str):
+    with pytest.raises(jwt.InvalidTokenError):
+        jwt.decode(token, SECRET, algorithms=['HS256'])
+    with pytest.raises(ValueError):
+        auth_service._decode_hs256(token)
+    assert auth_service._decode_token(token) is None
+
+
+def test_our_tokens_decode_with_pyjwt():
+    payload = _payload()
+    token = auth_service._encode_hs256(payload)
+    assert jwt.decode(token, SECRET, algorithms=['HS256']) == payload
+    assert jwt.get_unverified_header(token) == {'alg': 'HS256', 'typ': 'JWT'}
+
+
+def test_pyjwt_tokens_decode_with_ours():
+    payload = _payload()
+    token = jwt.encode(payload, SECRET, algorithm='HS256')
+    assert auth_service._decode_hs256(token) == payload
+
+
+def test_generated_token_matches_pyjwt():
+    token = auth_service._generate_token('user-1', 'user@example.com')
+    assert auth_service._decode_hs256(token) == jwt.decode(token, SECRET, algorithms=['HS256'])
+
+
+def test_expired_token_is_rejected():
+    _assert_both_reject(auth_service._encode_hs256(_payload(exp_offset=-10)))
+    _assert_both_reject(jwt.encode(_payload(exp_offset=-10), SECRET, algorithm='HS256'))
+
+
+def test_tampered_payload_is_rejected():
+    header, _, signature = auth_service._encode_hs256(_payload()).split('.')
+    forged = dict(_payload(), user_id='someone-else')
+    forged_segment = _b64url_encode(json.dumps(forged).encode()).decode()
+    _assert_both_reject('.'.join((header, forged_segment, signature)))
+
+
+def test_tampered_signature_is_rejected():
+    signing_input, _, signature = auth_service._encode_hs256(_payload()).rpartition('.')
+    # Change the first character: the last one partly encodes ignored padding bits
+    flipped = ('A' if signature[0] != 'A' else 'B') + signature[1:]
+    _assert_both_reject(signing_input + '.' + flipped)
+
+
+def test_wrong_key_is_rejected():
+    _assert_both_reject(jwt.encode(_payload(), SECRET + '-other', algorithm='HS256'))
+
+
+@pytest.mark.parametrize('algorithm', ['HS384', 'HS512'])
+def test_wrong_algorithm_is_rejected(algorithm):
+    _assert_both_reject(jwt.encode(_payload(), SECRET, algorithm=algorithm))
+
+
+def test_unsigned_token_is_rejected():
+    _assert_both_reject(jwt.encode(_payload(), None, algorithm='none'))
+
+
+@pytest.mark.parametrize('token', [
+    '',
+    'not-a-token',
+    'only.two',
+    'a.b.c.d',
+    '..',
+    'eyJhbGciOiJIUzI1NiJ9..',
+    'é.é.é',
+])
+def test_malformed_token_is_rejected(token):
+    _assert_both_reject(token)